@@ -8,19 +8,31 @@ Use this to verify your API setup before integrating with the ESP32 system.
 Setup:
     1. Get API key from https://console.groq.com
     2. Set your key below or use environment variable GROQ_API_KEY
-    3. pip install requests
+    3. pip install requests requests-toolbelt aiohttp orjson
     4. python test_groq_stt.py <audio_file.wav>
 
 Usage:
     python test_groq_stt.py                           # Interactive mode
     python test_groq_stt.py test.wav                  # Transcribe single file
     python test_groq_stt.py training_samples/hey_bob  # Transcribe all WAVs in folder
+    python test_groq_stt.py training_samples/hey_bob --batch  # Same, in as few API calls as possible
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+import aiohttp
+import asyncio
+import io
 import os
 import sys
-import json
+import orjson
+import time
+import random
+import wave
+import hashlib
+import functools
+from collections import OrderedDict, deque
 from pathlib import Path
 
 # ==============================================================================
@@ -36,12 +48,17 @@ from pathlib import Path
 #
 # ==============================================================================
 
-GROQ_API_KEY = "YOUR API KEY HERE"  # <-- PASTE YOUR KEY HERE
+GROQ_API_KEY = "YOUR_GROQ_API_KEY_HERE"  # <-- PASTE YOUR KEY HERE
 
 # ==============================================================================
 # END OF CONFIGURATION - Don't modify below unless you know what you're doing
 # ==============================================================================
 
+# Key check and auth header are computed once at import
+API_KEY_PLACEHOLDER = "YOUR_GROQ_API_KEY_HERE"
+API_KEY_SET = bool(GROQ_API_KEY) and GROQ_API_KEY != API_KEY_PLACEHOLDER
+AUTH_HEADER = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+
 # Groq Whisper API endpoint
 GROQ_API_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
 
@@ -54,9 +71,138 @@ WHISPER_MODELS = {
 # Default model
 DEFAULT_MODEL = "whisper-large-v3"
 
+# Max number of in-flight requests when transcribing a folder
+# (kept low so bursts stay under the free tier's 30 requests/minute)
+MAX_CONCURRENT = 5
+
+# Folder transcription timeout and retry settings
+DEFAULT_TIMEOUT = 30   # seconds, used until enough response times are recorded
+MIN_TIMEOUT = 5        # seconds, lower bound for the adaptive timeout
+MAX_RETRIES = 3        # retries on HTTP 429 or timeout
+
+_response_times = deque(maxlen=50)
+
+# Preflight checks - WAV files failing these are skipped without an API call
+EXPECTED_SAMPLE_RATE = 16000
+MIN_FRAMES = 1600  # 0.1 seconds at 16kHz
+
+# Batched folder transcription - clips are joined into one upload
+BATCH_SILENCE_SECONDS = 1.0          # silence inserted between clips
+BATCH_MAX_BYTES = 24 * 1024 * 1024   # stay under the 25 MB upload limit
+BATCH_TIMEOUT = 120                  # seconds, long uploads take a while
+BATCH_MIN_OVERLAP = 0.25             # seconds of a clip a segment must cover to count
+
+# Shared HTTP session - reuses the TLS connection across transcriptions
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.headers.update(AUTH_HEADER)
+
+# Transcription cache - identical audio is only sent to the API once
+CACHE_DIR = Path.home() / ".cache" / "groq_stt"
+CACHE_SIZE = 256  # Max entries kept in memory
+
+_transcription_cache = OrderedDict()
+
+# All async requests run on one loop so the aiohttp session (and its
+# keep-alive connections) survives between interactive commands. Both are
+# created on first use, so importing this module for its helpers is free.
+_loop = None
+_aio_session = None
+
 
 # ========== Functions ==========
 
+def audio_cache_key(audio_path, model):
+    """Content hash of an audio file plus the model used to transcribe it"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    h.update(model.encode())
+    return h.hexdigest()
+
+
+def cache_get(key):
+    """Look up a cached transcription in memory, then on disk"""
+    if key in _transcription_cache:
+        _transcription_cache.move_to_end(key)
+        return _transcription_cache[key]
+
+    cache_file = CACHE_DIR / f"{key}.json"
+    if not cache_file.exists():
+        return None
+
+    try:
+        result = orjson.loads(cache_file.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+    _cache_remember(key, result)
+    return result
+
+
+def _cache_remember(key, result):
+    """Store a result in the in-memory LRU, evicting the oldest entry"""
+    _transcription_cache[key] = result
+    _transcription_cache.move_to_end(key)
+    if len(_transcription_cache) > CACHE_SIZE:
+        _transcription_cache.popitem(last=False)
+
+
+def cache_put(key, result):
+    """Store a transcription in memory and persist it to disk"""
+    _cache_remember(key, result)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (CACHE_DIR / f"{key}.json").write_bytes(orjson.dumps(result))
+    except OSError as e:
+        print(f"WARNING: Could not write cache: {e}")
+
+
+def validate_wav(audio_path):
+    """
+    Check a WAV file's header locally before uploading it
+
+    Returns:
+        Error message, or None if the file looks usable (non-WAV files are not checked)
+    """
+    if not str(audio_path).lower().endswith(".wav"):
+        return None
+
+    try:
+        with wave.open(str(audio_path), "rb") as w:
+            if w.getnchannels() != 1:
+                return f"expected mono, got {w.getnchannels()} channels"
+            if w.getframerate() != EXPECTED_SAMPLE_RATE:
+                return f"expected {EXPECTED_SAMPLE_RATE} Hz, got {w.getframerate()} Hz"
+            if w.getnframes() < MIN_FRAMES:
+                return f"too short ({w.getnframes()} frames)"
+    except EOFError:
+        return "empty or truncated WAV file"
+    except wave.Error as e:
+        return f"invalid WAV file ({e})"
+
+    return None
+
+
+def _adaptive_timeout():
+    """Request timeout of twice the recent p95 response time"""
+    if len(_response_times) < 10:
+        return DEFAULT_TIMEOUT
+
+    times = sorted(_response_times)
+    p95 = times[int(0.95 * (len(times) - 1))]
+    return max(MIN_TIMEOUT, 2 * p95)
+
+
+def print_api_key_error():
+    """Explain how to set the API key"""
+    print("ERROR: Please set your Groq API key!")
+    print("  1. Get key from: https://console.groq.com")
+    print("  2. Set GROQ_API_KEY environment variable, or")
+    print("  3. Edit this file and replace YOUR_GROQ_API_KEY_HERE")
+
+
 def transcribe_audio(audio_path, model=DEFAULT_MODEL):
     """
     Transcribe an audio file using Groq's Whisper API
@@ -68,42 +214,45 @@ def transcribe_audio(audio_path, model=DEFAULT_MODEL):
     Returns:
         dict with 'text' key containing transcription
     """
-    if GROQ_API_KEY == "YOUR_GROQ_API_KEY_HERE":
-        print("ERROR: Please set your Groq API key!")
-        print("  1. Get key from: https://console.groq.com")
-        print("  2. Set GROQ_API_KEY environment variable, or")
-        print("  3. Edit this file and replace YOUR_GROQ_API_KEY_HERE")
+    if not API_KEY_SET:
+        print_api_key_error()
         return None
 
     if not os.path.exists(audio_path):
         print(f"ERROR: File not found: {audio_path}")
         return None
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}"
-    }
+    error = validate_wav(audio_path)
+    if error:
+        print(f"SKIPPED: {os.path.basename(audio_path)}: {error}")
+        return None
+
+    cache_key = audio_cache_key(audio_path, model)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
 
     try:
         with open(audio_path, "rb") as audio_file:
-            files = {
-                "file": (os.path.basename(audio_path), audio_file, "audio/wav")
-            }
-            data = {
+            # Streams the body from the file instead of building it in memory
+            encoder = MultipartEncoder(fields={
+                "file": (os.path.basename(audio_path), audio_file, "audio/wav"),
                 "model": model,
                 "response_format": "json",
                 "language": "en"  # Force English to avoid wrong language detection
-            }
+            })
 
-            response = requests.post(
+            response = SESSION.post(
                 GROQ_API_URL,
-                headers=headers,
-                files=files,
-                data=data,
+                data=encoder,
+                headers={"Content-Type": encoder.content_type},
                 timeout=30
             )
 
         if response.status_code == 200:
-            return response.json()
+            result = orjson.loads(response.content)
+            cache_put(cache_key, result)
+            return result
         else:
             print(f"ERROR: API returned {response.status_code}")
             print(f"Response: {response.text}")
@@ -117,15 +266,142 @@ def transcribe_audio(audio_path, model=DEFAULT_MODEL):
         return None
 
 
+async def transcribe_audio_async(session, audio_path, model=DEFAULT_MODEL):
+    """
+    Async version of transcribe_audio using a shared aiohttp session
+
+    Args:
+        session: aiohttp.ClientSession to send the request with
+        audio_path: Path to WAV/MP3/etc audio file
+        model: Whisper model to use
+
+    Returns:
+        dict with 'text' key containing transcription
+
+    Rate-limited (HTTP 429) and timed out requests are retried up to
+    MAX_RETRIES times with jittered exponential backoff.
+    """
+    error = validate_wav(audio_path)
+    if error:
+        print(f"SKIPPED: {os.path.basename(audio_path)}: {error}")
+        return None
+
+    cache_key = audio_cache_key(audio_path, model)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    name = os.path.basename(audio_path)
+
+    for attempt in range(MAX_RETRIES + 1):
+        start_time = time.monotonic()
+
+        try:
+            with open(audio_path, "rb") as audio_file:
+                form = aiohttp.FormData()
+                form.add_field("file", audio_file,
+                               filename=name,
+                               content_type="audio/wav")
+                form.add_field("model", model)
+                form.add_field("response_format", "json")
+                form.add_field("language", "en")  # Force English to avoid wrong language detection
+
+                async with session.post(
+                    GROQ_API_URL,
+                    data=form,
+                    timeout=aiohttp.ClientTimeout(total=_adaptive_timeout())
+                ) as response:
+                    if response.status == 200:
+                        result = orjson.loads(await response.read())
+                        _response_times.append(time.monotonic() - start_time)
+                        cache_put(cache_key, result)
+                        return result
+                    elif response.status != 429:
+                        print(f"ERROR: API returned {response.status} for {name}")
+                        print(f"Response: {await response.text()}")
+                        return None
+                    reason = "rate limited"
+
+        except asyncio.TimeoutError:
+            reason = "timed out"
+
+        if attempt < MAX_RETRIES:
+            delay = min(8, 0.5 * 2 ** attempt) + random.uniform(0, 0.25)
+            print(f"WARNING: {name} {reason}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    print(f"ERROR: {name} {reason} after {MAX_RETRIES} retries")
+    return None
+
+
+@functools.lru_cache(maxsize=32)
+def _list_wavs(folder, mtime_ns):
+    """WAV files in a folder - cached until the folder's mtime changes"""
+    return tuple(Path(folder).glob("*.wav"))
+
+
+def make_session():
+    """Create an aiohttp session for transcribe_audio_async (call inside a running loop)"""
+    connector = aiohttp.TCPConnector(limit=16, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, headers=AUTH_HEADER)
+
+
+async def _new_session():
+    return make_session()
+
+
+def run(coro):
+    """Run a coroutine on the shared event loop, created on first use"""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def get_session():
+    """Shared aiohttp session on the shared loop, created on first use"""
+    global _aio_session
+    if _aio_session is None or _aio_session.closed:
+        _aio_session = run(_new_session())
+    return _aio_session
+
+
+def close():
+    """Close the shared aiohttp session and event loop, if they were created"""
+    global _loop
+    if _loop is None:
+        return
+    if _aio_session is not None and not _aio_session.closed:
+        run(_aio_session.close())
+    _loop.close()
+    _loop = None
+
+
+async def _transcribe_files_async(session, wav_files, model):
+    """Transcribe files concurrently, at most MAX_CONCURRENT in flight"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+
+    async def bounded(wav_file):
+        async with semaphore:
+            return await transcribe_audio_async(session, str(wav_file), model)
+
+    tasks = [bounded(wav_file) for wav_file in wav_files]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
 def transcribe_folder(folder_path, model=DEFAULT_MODEL):
     """Transcribe all WAV files in a folder"""
+    if not API_KEY_SET:
+        print_api_key_error()
+        return
+
     folder = Path(folder_path)
 
     if not folder.exists():
         print(f"ERROR: Folder not found: {folder_path}")
         return
 
-    wav_files = list(folder.glob("*.wav"))
+    wav_files = list(_list_wavs(str(folder), os.stat(folder).st_mtime_ns))
 
     if not wav_files:
         print(f"No WAV files found in {folder_path}")
@@ -134,12 +410,17 @@ def transcribe_folder(folder_path, model=DEFAULT_MODEL):
     print(f"\nTranscribing {len(wav_files)} files from {folder_path}\n")
     print("=" * 60)
 
+    # Requests are sent concurrently; results come back in file order
+    responses = run(_transcribe_files_async(get_session(), wav_files, model))
+
     results = []
 
-    for i, wav_file in enumerate(wav_files, 1):
+    for i, (wav_file, result) in enumerate(zip(wav_files, responses), 1):
         print(f"\n[{i}/{len(wav_files)}] {wav_file.name}")
 
-        result = transcribe_audio(str(wav_file), model)
+        if isinstance(result, Exception):
+            print(f"    ERROR: {result!r}")
+            result = None
 
         if result:
             text = result.get("text", "")
@@ -162,12 +443,265 @@ def transcribe_folder(folder_path, model=DEFAULT_MODEL):
     return results
 
 
+def _group_batches(wav_files):
+    """
+    Split files into batches that fit in one upload
+
+    Returns:
+        (batches, singles) - singles are files that can't be concatenated
+        (not 16-bit) and must be sent on their own
+    """
+    silence_bytes = int(EXPECTED_SAMPLE_RATE * BATCH_SILENCE_SECONDS) * 2
+    batches = []
+    singles = []
+    batch = []
+    batch_bytes = 44  # WAV header
+
+    for wav_file in wav_files:
+        with wave.open(str(wav_file), "rb") as w:
+            if w.getsampwidth() != 2:
+                singles.append(wav_file)
+                continue
+            clip_bytes = w.getnframes() * 2 + silence_bytes
+
+        if batch and batch_bytes + clip_bytes > BATCH_MAX_BYTES:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 44
+
+        batch.append(wav_file)
+        batch_bytes += clip_bytes
+
+    if batch:
+        batches.append(batch)
+
+    return batches, singles
+
+
+def _build_batch_wav(wav_files):
+    """
+    Concatenate 16kHz mono 16-bit WAV files with silence between them
+
+    Returns:
+        (wav_bytes, spans) - spans holds the (start, end) time in seconds
+        of each input file within the combined audio
+    """
+    silence = b"\x00\x00" * int(EXPECTED_SAMPLE_RATE * BATCH_SILENCE_SECONDS)
+    spans = []
+    position = 0.0
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(EXPECTED_SAMPLE_RATE)
+
+        for i, wav_file in enumerate(wav_files):
+            if i > 0:
+                out.writeframes(silence)
+                position += BATCH_SILENCE_SECONDS
+
+            with wave.open(str(wav_file), "rb") as w:
+                out.writeframes(w.readframes(w.getnframes()))
+                duration = w.getnframes() / EXPECTED_SAMPLE_RATE
+
+            spans.append((position, position + duration))
+            position += duration
+
+    return buffer.getvalue(), spans
+
+
+def _transcribe_batch(wav_bytes, model):
+    """Transcribe a combined WAV, returns the list of timed segments or None"""
+    encoder = MultipartEncoder(fields=[
+        ("file", ("batch.wav", io.BytesIO(wav_bytes), "audio/wav")),
+        ("model", model),
+        ("response_format", "verbose_json"),
+        ("timestamp_granularities[]", "segment"),
+        ("language", "en")  # Force English to avoid wrong language detection
+    ])
+
+    try:
+        response = SESSION.post(
+            GROQ_API_URL,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            timeout=BATCH_TIMEOUT
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: {e}")
+        return None
+
+    if response.status_code != 200:
+        print(f"ERROR: API returned {response.status_code}")
+        print(f"Response: {response.text}")
+        return None
+
+    try:
+        result = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        print(f"ERROR: Invalid JSON response: {response.text[:200]}")
+        return None
+
+    if not isinstance(result, dict) or not isinstance(result.get("segments"), list):
+        print("ERROR: Response has no segment list")
+        return None
+
+    return result["segments"]
+
+
+def _split_segments(segments, spans):
+    """
+    Assign each segment to the clip whose audio it overlaps
+
+    Whisper's segments usually run back to back, so a segment often reaches
+    into the silence around a clip - only overlap with the clip's own audio
+    counts. Returns one text per clip, or None for clips that can't be
+    trusted: a segment covering more than BATCH_MIN_OVERLAP of two clips,
+    or no segment at all.
+
+    >>> spans = [(0, 2), (3, 5), (6, 8)]
+    >>> _split_segments([{"start": 0, "end": 3, "text": " one"},
+    ...                  {"start": 3, "end": 6, "text": " two"},
+    ...                  {"start": 6, "end": 8, "text": " three"}], spans)
+    ['one', 'two', 'three']
+    >>> _split_segments([{"start": 0, "end": 8, "text": "one two three"}], spans)
+    [None, None, None]
+    >>> _split_segments([{"start": 0, "end": 2, "text": "one"},
+    ...                  {"start": 6, "end": 8, "text": "three"}], spans)
+    ['one', None, 'three']
+    """
+    texts = [[] for _ in spans]
+    ambiguous = set()
+
+    for segment in segments:
+        overlaps = [
+            min(segment["end"], end) - max(segment["start"], start)
+            for start, end in spans
+        ]
+        covered = [i for i, overlap in enumerate(overlaps) if overlap > BATCH_MIN_OVERLAP]
+        if len(covered) > 1:
+            ambiguous.update(covered)
+            continue
+
+        best = max(range(len(spans)), key=overlaps.__getitem__)
+        if overlaps[best] <= 0:
+            continue  # only silence between clips
+        text = segment["text"].strip()
+        if text:
+            texts[best].append(text)
+
+    return [
+        None if i in ambiguous or not clip_texts else " ".join(clip_texts)
+        for i, clip_texts in enumerate(texts)
+    ]
+
+
+def transcribe_folder_batched(folder_path, model=DEFAULT_MODEL):
+    """
+    Transcribe all WAV files in a folder with as few API calls as possible
+
+    Clips are joined into one long WAV with silence between them, sent as a
+    single request, and the returned segments are mapped back to each clip
+    by timestamp. A batch that fails falls back to per-file requests.
+    """
+    if not API_KEY_SET:
+        print_api_key_error()
+        return
+
+    folder = Path(folder_path)
+
+    if not folder.exists():
+        print(f"ERROR: Folder not found: {folder_path}")
+        return
+
+    wav_files = list(_list_wavs(str(folder), os.stat(folder).st_mtime_ns))
+
+    if not wav_files:
+        print(f"No WAV files found in {folder_path}")
+        return
+
+    print(f"\nTranscribing {len(wav_files)} files from {folder_path} (batched)\n")
+    print("=" * 60)
+
+    texts = {}
+    pending = []
+
+    # Skip invalid files and reuse cached transcriptions
+    for wav_file in wav_files:
+        error = validate_wav(wav_file)
+        if error:
+            print(f"SKIPPED: {wav_file.name}: {error}")
+            continue
+
+        cached = cache_get(audio_cache_key(wav_file, model))
+        if cached is not None:
+            texts[wav_file] = cached.get("text", "")
+        else:
+            pending.append(wav_file)
+
+    batches, singles = _group_batches(pending)
+
+    for batch in batches:
+        print(f"\nSending batch of {len(batch)} files...")
+        wav_bytes, spans = _build_batch_wav(batch)
+        segments = _transcribe_batch(wav_bytes, model)
+
+        if segments is None:
+            print("Batch failed, falling back to one request per file")
+            singles.extend(batch)
+            continue
+
+        retry = []
+        for wav_file, text in zip(batch, _split_segments(segments, spans)):
+            if text is None:
+                retry.append(wav_file)
+                continue
+            texts[wav_file] = text
+            cache_put(audio_cache_key(wav_file, model), {"text": text})
+
+        if retry:
+            print(f"Couldn't split {len(retry)} file(s) from the batch, sending them one by one")
+            singles.extend(retry)
+
+    if singles:
+        responses = run(_transcribe_files_async(get_session(), singles, model))
+        for wav_file, result in zip(singles, responses):
+            if isinstance(result, dict):
+                texts[wav_file] = result.get("text", "")
+
+    results = []
+
+    for i, wav_file in enumerate(wav_files, 1):
+        print(f"\n[{i}/{len(wav_files)}] {wav_file.name}")
+
+        text = texts.get(wav_file)
+        if text:
+            print(f"    -> \"{text}\"")
+            results.append({
+                "file": wav_file.name,
+                "text": text
+            })
+        else:
+            print(f"    -> FAILED")
+            results.append({
+                "file": wav_file.name,
+                "text": None,
+                "error": True
+            })
+
+    print("\n" + "=" * 60)
+    print(f"Completed: {len([r for r in results if r.get('text')])} / {len(wav_files)}")
+
+    return results
+
+
 def interactive_mode():
     """Interactive mode for testing transcription"""
     print("\n" + "=" * 50)
     print("  Groq Speech-to-Text Test")
     print("=" * 50)
-    print(f"\nAPI Key: {'*' * 20}{GROQ_API_KEY[-8:]}" if GROQ_API_KEY != "YOUR_GROQ_API_KEY_HERE" else "\nAPI Key: NOT SET")
+    print(f"\nAPI Key: {'*' * 20}{GROQ_API_KEY[-8:]}" if API_KEY_SET else "\nAPI Key: NOT SET")
     print(f"Model: {DEFAULT_MODEL}")
     print("\nCommands:")
     print("  <filepath>  - Transcribe a single file")
@@ -234,7 +768,10 @@ def main():
             return
 
         if os.path.isdir(target):
-            transcribe_folder(target)
+            if '--batch' in sys.argv[2:]:
+                transcribe_folder_batched(target)
+            else:
+                transcribe_folder(target)
         elif os.path.isfile(target):
             result = transcribe_audio(target)
             if result:
@@ -247,4 +784,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close()
@@ -13,8 +13,10 @@ This simulates what will happen on the ESP32:
 
 Setup:
     1. Get API key from https://console.groq.com
-    2. pip install requests
+    2. pip install "httpx[http2]" orjson
+       (plus test_groq_stt.py's requirements - its cache helpers are shared)
     3. python test_voice_pipeline.py <audio_file.wav>
+       python test_voice_pipeline.py a.wav b.wav ...   (pipelines run concurrently)
 
 Groq Free Tier Limits:
     - 30 requests per minute
@@ -22,11 +24,18 @@ Groq Free Tier Limits:
     - No credit card required
 """
 
-import requests
+import httpx
+import asyncio
 import os
 import sys
-import json
+import orjson
+import re
 import time
+import hashlib
+from collections import OrderedDict
+
+# Shared WAV preflight and transcription cache (same ~/.cache/groq_stt entries as test_groq_stt.py)
+import test_groq_stt as stt
 
 # ==============================================================================
 # CONFIGURATION - PASTE YOUR API KEY HERE
@@ -47,6 +56,12 @@ GROQ_API_KEY = "YOUR_GROQ_API_KEY_HERE"  # <-- PASTE YOUR KEY HERE
 # END OF CONFIGURATION - Don't modify below unless you know what you're doing
 # ==============================================================================
 
+# Key check and auth header are computed once at import
+API_KEY_PLACEHOLDER = "YOUR_GROQ_API_KEY_HERE"
+API_KEY_SET = bool(GROQ_API_KEY) and GROQ_API_KEY != API_KEY_PLACEHOLDER
+AUTH_HEADER = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+JSON_HEADER = {"Content-Type": "application/json"}
+
 # API endpoints
 WHISPER_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
 LLM_URL = "https://api.groq.com/openai/v1/chat/completions"
@@ -55,6 +70,24 @@ LLM_URL = "https://api.groq.com/openai/v1/chat/completions"
 WHISPER_MODEL = "whisper-large-v3"
 LLM_MODEL = "llama-3.1-8b-instant"  # Updated - llama3-8b was deprecated
 
+# Shared HTTP/2 client - the Whisper and LLM calls (and concurrent pipelines)
+# are multiplexed as streams over one TLS connection to api.groq.com
+CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    headers=AUTH_HEADER
+)
+
+# All API calls run on this loop so CLIENT's connection survives between commands
+LOOP = asyncio.new_event_loop()
+
+# Parsed intents are cached in memory so repeated phrases skip the LLM call
+# (transcriptions use test_groq_stt's content-hash cache)
+CACHE_SIZE = 256  # Max intents kept in memory
+
+_intent_cache = OrderedDict()
+
 # System prompt for intent parsing
 SYSTEM_PROMPT = """You are a smart home assistant. Parse user commands and return JSON.
 
@@ -76,12 +109,67 @@ Examples:
 - "it's hot" -> {"actions": [{"type": "ac_on"}, {"type": "ac_mode", "value": "cool"}]}
 """
 
+# Local rules for common commands - a phrase that fully matches one of these
+# is parsed without calling the LLM. Text is lowercased with sentence
+# punctuation removed first (a decimal point is kept, so "2.4" never matches).
+# Values outside the remote's range (16-30 C, signals 1-40) don't match and are
+# left to the LLM.
+_AC = r"(?:the )?(?:ac|a/c|air ?con(?:ditioner)?)"
+
+RULES = [
+    (re.compile(rf"(?:please )?(?:turn|switch) on {_AC}(?: please)?"),
+     lambda m: {"actions": [{"type": "ac_on"}]}),
+    (re.compile(rf"(?:please )?(?:turn|switch) off {_AC}(?: please)?"),
+     lambda m: {"actions": [{"type": "ac_off"}]}),
+    (re.compile(r"(?:please )?(?:turn|switch) on (?:the )?lights?|(?:turn|switch) (?:the )?lights? on"),
+     lambda m: {"actions": [{"type": "light_on"}]}),
+    (re.compile(r"(?:please )?(?:turn|switch) off (?:the )?lights?|(?:turn|switch) (?:the )?lights? off"),
+     lambda m: {"actions": [{"type": "light_off"}]}),
+    (re.compile(r"(?:turn|switch) off (?:all(?: the)? devices|everything)"),
+     lambda m: {"actions": [{"type": "ac_off"}, {"type": "light_off"}]}),
+    (re.compile(r"(?:set|change) (?:(?:the )?(?:temperature|temp|ac) )?to (1[6-9]|2\d|30)(?: degrees?)?(?: celsius)?|(1[6-9]|2\d|30) degrees?(?: celsius)?"),
+     lambda m: {"actions": [{"type": "ac_temp", "value": int(m.group(1) or m.group(2))}]}),
+    (re.compile(r"(?:switch|change|set) (?:it |the ac )?to (cool|heat|dry|fan|auto)(?:ing)?(?: mode)?"),
+     lambda m: {"actions": [{"type": "ac_mode", "value": m.group(1)}]}),
+    (re.compile(r"it'?s (?:too |really |very |so )?hot(?: in here)?"),
+     lambda m: {"actions": [{"type": "ac_on"}, {"type": "ac_mode", "value": "cool"}]}),
+    (re.compile(r"send (?:ir )?signal ([1-9]|[1-3]\d|40)"),
+     lambda m: {"actions": [{"type": "ir_send", "value": int(m.group(1))}]}),
+]
+
+# Normalized phrase -> handled by a local rule, so a repeated phrase counts once
+_rule_stats = {}
+
 
 # ========== Functions ==========
 
+def _intent_cache_key(text):
+    """Hash of the prompt and user text sent to the LLM"""
+    return hashlib.sha256((LLM_MODEL + SYSTEM_PROMPT + text).encode()).hexdigest()
+
+
+def _cache_remember(cache, key, value):
+    """Store a value in an in-memory LRU, evicting the oldest entry"""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def run(coro):
+    """Run a coroutine on the shared event loop"""
+    return LOOP.run_until_complete(coro)
+
+
+def close():
+    """Close the HTTP client and the shared event loop"""
+    run(CLIENT.aclose())
+    LOOP.close()
+
+
 def check_api_key():
     """Check if API key is configured"""
-    if GROQ_API_KEY == "YOUR_GROQ_API_KEY_HERE":
+    if not API_KEY_SET:
         print("=" * 50)
         print("ERROR: Groq API key not configured!")
         print("=" * 50)
@@ -98,7 +186,7 @@ def check_api_key():
     return True
 
 
-def transcribe_audio(audio_path):
+async def transcribe_audio(audio_path):
     """
     Step 1: Convert audio to text using Groq Whisper
     """
@@ -108,7 +196,17 @@ def transcribe_audio(audio_path):
         print(f"      ERROR: File not found: {audio_path}")
         return None
 
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+    error = stt.validate_wav(audio_path)
+    if error:
+        print(f"      SKIPPED: {error}")
+        return None
+
+    cache_key = stt.audio_cache_key(audio_path, WHISPER_MODEL)
+    cached = stt.cache_get(cache_key)
+    if cached is not None:
+        text = cached.get("text", "").strip()
+        print(f"      Transcription: \"{text}\" (cached)")
+        return text
 
     try:
         with open(audio_path, "rb") as f:
@@ -116,11 +214,12 @@ def transcribe_audio(audio_path):
             data = {"model": WHISPER_MODEL, "language": "en"}
 
             start_time = time.time()
-            response = requests.post(WHISPER_URL, headers=headers, files=files, data=data, timeout=30)
+            response = await CLIENT.post(WHISPER_URL, files=files, data=data)
             elapsed = time.time() - start_time
 
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
+            stt.cache_put(cache_key, result)
             text = result.get("text", "").strip()
             print(f"      Transcription: \"{text}\"")
             print(f"      Time: {elapsed:.2f}s")
@@ -135,16 +234,61 @@ def transcribe_audio(audio_path):
         return None
 
 
-def parse_intent(text):
+def _normalize(text):
+    """Lowercase, drop sentence punctuation and collapse whitespace for rule matching"""
+    return " ".join(re.sub(r"[,!?]|\.(?!\d)", "", text.lower()).split())
+
+
+def match_local_rule(text):
+    """
+    Parse common commands locally, returns an intent or None
+
+    >>> match_local_rule("Set the temperature to 24.")
+    {'actions': [{'type': 'ac_temp', 'value': 24}]}
+    >>> match_local_rule("set the temperature to 2.4") is None
+    True
+    >>> match_local_rule("set to 1.8") is None
+    True
+    >>> match_local_rule("send signal 1.5") is None
+    True
+    >>> match_local_rule("set to 99") is None
+    True
+    """
+    normalized = _normalize(text)
+
+    for pattern, make_intent in RULES:
+        match = pattern.fullmatch(normalized)
+        if match:
+            return make_intent(match)
+
+    return None
+
+
+def print_rule_stats():
+    """Show how many phrases were handled without an LLM call"""
+    hits, total = sum(_rule_stats.values()), len(_rule_stats)
+    if total:
+        print(f"Local rules handled {hits}/{total} phrases ({100 * hits / total:.0f}%)")
+
+
+async def parse_intent(text):
     """
-    Step 2: Parse intent using Groq LLaMA
+    Step 2: Parse intent - local rules first, then Groq LLaMA
     """
     print(f"[2/3] Parsing intent...")
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    intent = match_local_rule(text)
+    _rule_stats[_normalize(text)] = intent is not None
+    if intent:
+        print(f"      Intent: {orjson.dumps(intent).decode()} (local rule)")
+        return intent
+
+    cache_key = _intent_cache_key(text)
+    if cache_key in _intent_cache:
+        _intent_cache.move_to_end(cache_key)
+        intent = _intent_cache[cache_key]
+        print(f"      Intent: {orjson.dumps(intent).decode()} (cached)")
+        return intent
 
     payload = {
         "model": LLM_MODEL,
@@ -158,11 +302,11 @@ def parse_intent(text):
 
     try:
         start_time = time.time()
-        response = requests.post(LLM_URL, headers=headers, json=payload, timeout=30)
+        response = await CLIENT.post(LLM_URL, content=orjson.dumps(payload), headers=JSON_HEADER)
         elapsed = time.time() - start_time
 
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             content = result["choices"][0]["message"]["content"]
 
             # Try to parse JSON from response
@@ -172,15 +316,16 @@ def parse_intent(text):
                 json_end = content.rfind("}") + 1
                 if json_start >= 0 and json_end > json_start:
                     json_str = content[json_start:json_end]
-                    intent = json.loads(json_str)
+                    intent = orjson.loads(json_str)
                 else:
-                    intent = json.loads(content)
+                    intent = orjson.loads(content)
 
-                print(f"      Intent: {json.dumps(intent)}")
+                print(f"      Intent: {orjson.dumps(intent).decode()}")
                 print(f"      Time: {elapsed:.2f}s")
+                _cache_remember(_intent_cache, cache_key, intent)
                 return intent
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print(f"      WARNING: Could not parse JSON from: {content}")
                 return {"raw": content, "actions": []}
 
@@ -233,7 +378,7 @@ def execute_actions(intent):
             print(f"      -> Unknown action: {action_type}")
 
 
-def process_voice_command(audio_path):
+async def process_voice_command(audio_path):
     """
     Full pipeline: Audio -> Text -> Intent -> Execute
     """
@@ -248,15 +393,17 @@ def process_voice_command(audio_path):
     total_start = time.time()
 
     # Step 1: Transcribe
-    text = transcribe_audio(audio_path)
+    text = await transcribe_audio(audio_path)
     if not text:
         print("\nPipeline FAILED at transcription step")
         return False
 
     print()
 
-    # Step 2: Parse intent
-    intent = parse_intent(text)
+    # Step 2: Parse intent - this waits for the complete transcript. Groq's
+    # transcription endpoint returns the whole text in a single response
+    # (no partial results), so there is nothing to start the LLM call on early.
+    intent = await parse_intent(text)
     if not intent:
         print("\nPipeline FAILED at intent parsing step")
         return False
@@ -276,6 +423,13 @@ def process_voice_command(audio_path):
     return True
 
 
+async def process_voice_commands(audio_paths):
+    """
+    Run several pipelines concurrently (output is interleaved)
+    """
+    return await asyncio.gather(*(process_voice_command(p) for p in audio_paths))
+
+
 def test_llm_only(text):
     """Test LLM parsing with text input (no audio)"""
     if not check_api_key():
@@ -287,7 +441,7 @@ def test_llm_only(text):
     print(f"  Input: \"{text}\"")
     print("=" * 60 + "\n")
 
-    intent = parse_intent(text)
+    intent = run(parse_intent(text))
     if intent:
         print()
         execute_actions(intent)
@@ -337,13 +491,14 @@ def interactive_mode():
             for phrase in demo_phrases:
                 print(f"\nTesting: \"{phrase}\"")
                 print("-" * 40)
-                intent = parse_intent(phrase)
+                intent = run(parse_intent(phrase))
                 if intent:
                     execute_actions(intent)
                 print()
+            print_rule_stats()
 
         elif os.path.exists(cmd):
-            process_voice_command(cmd)
+            run(process_voice_command(cmd))
 
         else:
             # Try as direct text input
@@ -377,13 +532,18 @@ def main():
                 print(f"\n{'='*50}")
                 print(f"Testing: \"{phrase}\"")
                 print('='*50)
-                intent = parse_intent(phrase)
+                intent = run(parse_intent(phrase))
                 if intent:
                     execute_actions(intent)
+            print()
+            print_rule_stats()
             return
 
         if os.path.exists(arg):
-            process_voice_command(arg)
+            if len(sys.argv) > 2:
+                run(process_voice_commands(sys.argv[1:]))
+            else:
+                run(process_voice_command(arg))
         else:
             # Treat as text input
             test_llm_only(arg)
@@ -392,4 +552,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close()
@@ -93,6 +93,10 @@ void loop() {
     else if (command == "test" || command == "mic_test") {
       testMicrophoneLevel();
     }
+    else if (command == "ready?") {
+      // Handshake used by capture_samples.py between batch recordings
+      Serial.println("---READY---");
+    }
     else if (command == "help") {
       Serial.println("\nCommands:");
       Serial.println("  hey_bob  - Record wake word sample");
@@ -9,9 +9,13 @@ Usage:
     python capture_samples.py                    # Interactive mode
     python capture_samples.py hey_bob            # Record one hey_bob sample
     python capture_samples.py noise --count 10   # Record 10 noise samples
+    python capture_samples.py hey_bob -t         # Record one hey_bob sample and transcribe it with Groq
+    python capture_samples.py hey_bob -c 10 -t   # Record 10 and transcribe each with Groq
+                                                 # (--transcribe needs a label, not interactive mode)
 
 Requirements:
     pip install pyserial
+    pip install requests requests-toolbelt aiohttp orjson   # Only for --transcribe
 
 Setup:
     1. Upload audio_capture.ino to ESP32
@@ -21,8 +25,12 @@ Setup:
 
 import serial
 import serial.tools.list_ports
+import asyncio
+import binascii
 import os
+import re
 import sys
+import threading
 import time
 from datetime import datetime
 
@@ -31,6 +39,15 @@ SERIAL_PORT = "COM5"  # Auto-detect if None, or set manually: "COM3" or "/dev/tt
 BAUD_RATE = 115200
 OUTPUT_DIR = "training_samples"
 TIMEOUT = 15  # seconds to wait for recording
+UPLOAD_QUEUE_SIZE = 8  # Max saved samples waiting for transcription (--transcribe)
+UPLOAD_WORKERS = 4     # Concurrent transcription requests (--transcribe)
+READY_TIMEOUT = 3           # seconds to wait for ---READY--- between batch samples
+READY_FALLBACK_DELAY = 0.5  # seconds to pause instead if the firmware doesn't answer
+
+# WAV framing markers sent by the ESP32. Two start formats are supported:
+#   ---WAV_START:<label>---          hex follows until ---WAV_END---
+#   ---WAV_START:<label>:<nbytes>--- nbytes of raw binary WAV follow
+MARKER_RE = re.compile(rb"---WAV_(START(?::([A-Za-z0-9_]+))?(?::(\d+))?|END)---")
 
 
 def find_esp32_port():
@@ -66,8 +83,14 @@ def list_ports():
     print()
 
 
-def capture_sample(ser, label):
-    """Send record command and capture WAV data"""
+def capture_sample(ser, label, stop_event=None):
+    """Send record command and capture WAV data
+
+    stop_event, if given, is a threading.Event that aborts the capture
+    (checked on every read) when set from another thread
+
+    Returns the saved filename, or False on failure
+    """
 
     # Clear any pending data
     ser.reset_input_buffer()
@@ -78,60 +101,106 @@ def capture_sample(ser, label):
     print(f"\nSent command: {label}")
     print("Waiting for ESP32 to record...")
 
-    # Wait for WAV data
-    capturing = False
-    hex_data = ""
+    # Read serial output in bulk into one buffer and parse it in place
+    buf = bytearray()
+    echoed = 0          # End of the last ESP32 output line printed
+    payload_start = -1  # Offset just after the ---WAV_START--- line
+    nbytes = None       # Payload size for binary transfers, None for hex
+    scan_from = 0       # Where to resume searching for ---WAV_END---
+    hex_end = -1
     actual_label = label
 
-    start_time = time.time()
+    # Fixed deadline until the start marker; after that it is pushed back
+    # whenever payload data arrives, so a long transfer isn't cut off
+    deadline = time.time() + TIMEOUT
 
     while True:
+        if stop_event is not None and stop_event.is_set():
+            return False
+
         # Check timeout
-        if time.time() - start_time > TIMEOUT:
+        if time.time() > deadline:
             print("ERROR: Timeout waiting for data")
             return False
 
-        # Read line
+        # Read whatever is waiting, or block for at least one byte
         try:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            chunk = ser.read(max(1, ser.in_waiting))
         except Exception as e:
             print(f"Read error: {e}")
             continue
 
-        if not line:
+        if not chunk:
             continue
 
-        # Print ESP32 output (except hex data)
-        if not capturing:
-            print(f"  {line}")
-
-        # Check for WAV start marker
-        if line.startswith("---WAV_START"):
-            capturing = True
+        if payload_start >= 0:
+            deadline = time.time() + TIMEOUT
+        buf.extend(chunk)
+
+        if payload_start < 0:
+            # Check for WAV start marker (stray end markers are ignored)
+            start_marker = None
+            for marker in MARKER_RE.finditer(buf, echoed):
+                if marker.group(1) != b"END":
+                    start_marker = marker
+                    break
+
+            # Print ESP32 output line by line up to the start marker
+            limit = start_marker.start() if start_marker else len(buf)
+            while True:
+                eol = buf.find(b"\n", echoed, limit)
+                if eol < 0:
+                    break
+                line = buf[echoed:eol].decode('utf-8', errors='ignore').strip()
+                if line:
+                    print(f"  {line}")
+                echoed = eol + 1
+
+            # Payload starts on the line after the marker
+            eol = buf.find(b"\n", start_marker.end()) if start_marker else -1
+            if eol < 0:
+                continue
+
+            print(f"  {start_marker.group(0).decode()}")
             # Extract label from marker if present
-            if ":" in line:
-                actual_label = line.split(":")[1].replace("---", "").strip()
+            if start_marker.group(2):
+                actual_label = start_marker.group(2).decode()
+            if start_marker.group(3):
+                nbytes = int(start_marker.group(3))
+            payload_start = scan_from = echoed = eol + 1
+            deadline = time.time() + TIMEOUT
             print("\n  Receiving WAV data...")
-            continue
 
-        # Check for WAV end marker
-        if "---WAV_END---" in line:
-            break
-
-        # Capture hex data
-        if capturing:
-            hex_data += line
+        if nbytes is not None:
+            if len(buf) - payload_start >= nbytes:
+                break
+        else:
+            # Check for WAV end marker in the newly received data only
+            end_marker = MARKER_RE.search(buf, scan_from)
+            if end_marker:
+                hex_end = end_marker.start()
+                break
+            scan_from = max(payload_start, len(buf) - len(b"---WAV_END---"))
+
+    if nbytes is not None:
+        binary_data = bytes(buf[payload_start:payload_start + nbytes])
+    else:
+        hex_region = bytes(buf[payload_start:hex_end]).translate(None, b"\r\n\t ")
+
+        # Validate data
+        if not hex_region:
+            print("ERROR: No audio data received")
+            return False
 
-    # Validate data
-    if not hex_data:
-        print("ERROR: No audio data received")
-        return False
+        # Convert hex to binary (straight from bytes, no text decode)
+        try:
+            binary_data = binascii.unhexlify(hex_region)
+        except binascii.Error as e:
+            print(f"ERROR: Invalid hex data: {e}")
+            return False
 
-    # Convert hex to binary
-    try:
-        binary_data = bytes.fromhex(hex_data)
-    except ValueError as e:
-        print(f"ERROR: Invalid hex data: {e}")
+    # Don't save a sample if the capture was cancelled meanwhile
+    if stop_event is not None and stop_event.is_set():
         return False
 
     # Create output directory
@@ -152,7 +221,7 @@ def capture_sample(ser, label):
     print(f"\n  Saved: {filename}")
     print(f"  Size: {file_size} bytes ({duration:.2f} seconds)")
 
-    return True
+    return filename
 
 
 def interactive_mode(ser):
@@ -236,6 +305,26 @@ def show_counts(counts):
     print(f"    Total:   {total:3d} samples")
 
 
+def wait_until_ready(ser, stop_event=None):
+    """Ask the ESP32 if it can take the next recording
+
+    Returns True once ---READY--- is received, False after READY_TIMEOUT
+    (firmware without the handshake never answers) or once stop_event is set
+    """
+
+    ser.reset_input_buffer()
+    ser.write(b"ready?\n")
+
+    deadline = time.time() + READY_TIMEOUT
+    while time.time() < deadline:
+        if stop_event is not None and stop_event.is_set():
+            return False
+        if b"---READY---" in ser.readline():
+            return True
+
+    return False
+
+
 def batch_record(ser, label, count):
     """Record multiple samples of the same type"""
 
@@ -243,6 +332,7 @@ def batch_record(ser, label, count):
     print("Press Ctrl+C to cancel\n")
 
     successful = 0
+    use_handshake = True
 
     for i in range(count):
         print(f"\n--- Sample {i+1}/{count} ---")
@@ -251,8 +341,11 @@ def batch_record(ser, label, count):
                 successful += 1
 
             if i < count - 1:
-                print("\nNext sample in 2 seconds...")
-                time.sleep(2)
+                # Start the next sample as soon as the ESP32 is ready
+                print("\nPreparing next sample...")
+                if not (use_handshake and wait_until_ready(ser)):
+                    use_handshake = False
+                    time.sleep(READY_FALLBACK_DELAY)
 
         except KeyboardInterrupt:
             print("\n\nBatch recording cancelled")
@@ -261,6 +354,106 @@ def batch_record(ser, label, count):
     print(f"\nCompleted: {successful}/{count} samples recorded")
 
 
+def load_stt_module():
+    """Import the Groq transcription helpers from LLMtesting/test_groq_stt.py"""
+    llm_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LLMtesting")
+    if llm_dir not in sys.path:
+        sys.path.insert(0, llm_dir)
+    import test_groq_stt
+    return test_groq_stt
+
+
+def transcribe_sample(filename):
+    """Transcribe a single saved sample with Groq"""
+
+    stt = load_stt_module()
+    if not stt.API_KEY_SET:
+        stt.print_api_key_error()
+        return
+
+    result = stt.transcribe_audio(filename)
+    name = os.path.basename(filename)
+    if result:
+        print(f"\n  [STT] {name} -> \"{result.get('text', '')}\"")
+    else:
+        print(f"\n  [STT] {name} -> FAILED")
+
+
+async def batch_record_transcribe(ser, label, count):
+    """Record multiple samples, transcribing each one while the next is captured"""
+
+    stt = load_stt_module()
+    if not stt.API_KEY_SET:
+        stt.print_api_key_error()
+        return
+
+    print(f"\nBatch recording {count} '{label}' samples (with transcription)...")
+    print("Press Ctrl+C to cancel\n")
+
+    # Capture is the producer, transcription workers are the consumers
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    transcribed = []
+    processed = []
+
+    async def worker(session):
+        while True:
+            filename = await queue.get()
+            name = os.path.basename(filename)
+            try:
+                result = await stt.transcribe_audio_async(session, filename)
+                if result:
+                    text = result.get("text", "")
+                    print(f"\n  [STT] {name} -> \"{text}\"")
+                    transcribed.append(filename)
+                else:
+                    print(f"\n  [STT] {name} -> FAILED")
+            except Exception as e:
+                print(f"\n  [STT] {name} -> ERROR: {e}")
+            finally:
+                processed.append(filename)
+                queue.task_done()
+
+    successful = 0
+    use_handshake = True
+
+    # Serial capture blocks, so it runs in a worker thread. Setting this
+    # stops that thread promptly when the batch is cancelled (Ctrl+C)
+    # instead of letting it finish or save another sample.
+    stop = threading.Event()
+
+    async with stt.make_session() as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(UPLOAD_WORKERS)]
+
+        try:
+            for i in range(count):
+                print(f"\n--- Sample {i+1}/{count} ---")
+
+                filename = await asyncio.to_thread(capture_sample, ser, label, stop)
+                if filename:
+                    successful += 1
+                    await queue.put(filename)  # Waits only if the queue is full
+
+                if i < count - 1:
+                    # Start the next sample as soon as the ESP32 is ready
+                    print("\nPreparing next sample...")
+                    if not (use_handshake and await asyncio.to_thread(wait_until_ready, ser, stop)):
+                        use_handshake = False
+                        await asyncio.sleep(READY_FALLBACK_DELAY)
+
+            if len(processed) < successful:
+                print("\nWaiting for remaining transcriptions...")
+            await queue.join()
+
+        finally:
+            stop.set()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    print(f"\nCompleted: {successful}/{count} samples recorded, "
+          f"{len(transcribed)} transcribed")
+
+
 def main():
     """Main entry point"""
 
@@ -270,6 +463,7 @@ def main():
     label = None
     count = 1
     port_override = None
+    transcribe = False
 
     args = sys.argv[1:]
     i = 0
@@ -286,6 +480,11 @@ def main():
             i += 2
             continue
 
+        if arg in ['--transcribe', '-t']:
+            transcribe = True
+            i += 1
+            continue
+
         if arg in ['--list', '-l']:
             list_ports()
             return
@@ -329,12 +528,21 @@ def main():
     try:
         if label:
             # Single label mode
-            if count > 1:
+            if count > 1 and transcribe:
+                try:
+                    asyncio.run(batch_record_transcribe(ser, label, count))
+                except KeyboardInterrupt:
+                    print("\n\nBatch recording cancelled")
+            elif count > 1:
                 batch_record(ser, label, count)
             else:
-                capture_sample(ser, label)
+                filename = capture_sample(ser, label)
+                if filename and transcribe:
+                    transcribe_sample(filename)
         else:
             # Interactive mode
+            if transcribe:
+                print("NOTE: --transcribe needs a label, ignored in interactive mode")
             interactive_mode(ser)
 
     finally: